@@ -92,6 +92,10 @@ class DigitalCourtroomClient {
                     if (callbacks.onDebateUpdate) callbacks.onDebateUpdate(message.data);
                     break;
 
+                case 'token_delta':
+                    if (callbacks.onTokenDelta) callbacks.onTokenDelta(message.data);
+                    break;
+
                 case 'human_input_required':
                     if (callbacks.onHumanInputRequired) {
                         callbacks.onHumanInputRequired(message.data);
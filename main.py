@@ -2,9 +2,19 @@
 Main entry point for the Digital Courtroom application
 """
 
+import os
+import sys
+
 import uvicorn
 from src.api.main import app
 
+# 开发模式：设置环境变量 DEV_MODE=1 启用热重载
+DEV_MODE = os.getenv("DEV_MODE", "").lower() in ("1", "true", "yes")
+
+# worker进程数。会话与WebSocket连接保存在进程内存中，
+# 只有在会话状态外置（共享checkpointer与广播通道）后才能调大
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
 
 def main():
     """启动FastAPI服务器"""
@@ -12,7 +22,13 @@ def main():
         "src.api.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,  # 开发模式下启用热重载
+        reload=DEV_MODE,  # 仅开发模式下启用热重载
+        workers=1 if DEV_MODE else WEB_CONCURRENCY,  # 热重载与多worker互斥
+        # uvloop 不支持 Windows，该平台回退到默认事件循环
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
         log_level="info",
     )
 
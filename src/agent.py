@@ -1,95 +1,158 @@
+from functools import lru_cache
+
 from langchain_core.messages import SystemMessage, ChatMessage, HumanMessage
-from langgraph.types import interrupt,Command
+from langgraph.types import interrupt
+from langgraph.config import get_stream_writer
+
+from src.prompt import (
+    STATEMENT_PROMPT,
+    ARGUE_PROMPT_PL,
+    DEMURRER_PROMPT,
+    ARGUE_PROMPT_DE,
+    SUMMARY,
+    VERDICT,
+    judge_prompt,
+)
+from src.state import CourtState
+from src.llmconfig import get_model, llm_slots
+
+
+#大模型选择。客户端在首次发言时才构建（get_model按模型名缓存），导入本模块不加载模型SDK
+DS_V3 = "DeepSeek-V3"
+DS_R1 = "DeepSeek-R1"
+
+
+@lru_cache(maxsize=None)
+def get_decider():
+    """是否继续辩论只需一个词，用V3做确定性的单token判断即可"""
+    return get_model(DS_V3).bind(max_tokens=1, temperature=0)
+
+
+#系统提示词只构建一次，各轮发言复用同一个对象
+SYS_STATEMENT = SystemMessage(content=STATEMENT_PROMPT)
+SYS_ARGUE_PL = SystemMessage(content=ARGUE_PROMPT_PL)
+SYS_DEMURRER = SystemMessage(content=DEMURRER_PROMPT)
+SYS_ARGUE_DE = SystemMessage(content=ARGUE_PROMPT_DE)
+SYS_SUMMARY = SystemMessage(content=SUMMARY)
+SYS_VERDICT = SystemMessage(content=VERDICT)
 
-from src.prompt import *
-from src.state import *
-from src.llmconfig import models
+#预先切分判断模板，每轮只需拼接辩论记录
+JUDGE_PROMPT_HEAD, JUDGE_PROMPT_TAIL = judge_prompt.template.split("{messages}")
 
 
-#大模型选择
-ds_V3 = models["DeepSeek_V3"]
-ds_R1 = models["DeepSeek_R1"]
+#发给模型的最近发言条数。法官每三条发言做一次小结，窗口内总能包含最近一次小结
+CONTEXT_WINDOW = 6
+
+
+def build_context(system: SystemMessage, state: CourtState) -> tuple:
+    """组装模型输入：系统提示词 + 开庭信息 + 最近CONTEXT_WINDOW条发言，前缀保持稳定以便服务端缓存"""
+    messages = state["messages"]
+    if len(messages) <= CONTEXT_WINDOW + 1:
+        return (system, *messages)
+    return (system, messages[0], *messages[-CONTEXT_WINDOW:])
+
+
+def append_transcript(state: CourtState, speaker: str, content: str) -> str:
+    """在已格式化的辩论记录末尾追加一条发言"""
+    return f"{state.get('formatted_transcript', '')}{speaker}: {content}\n"
+
+
+async def generate(model, model_input, speaker: str) -> str:
+    """流式调用大模型，把增量内容写入LangGraph的custom流供前端实时展示，返回完整回复"""
+    writer = get_stream_writer()
+    chunks = []
+    async with llm_slots:
+        async for chunk in model.astream(model_input):
+            if chunk.content:
+                chunks.append(chunk.content)
+                writer({"speaker": speaker, "delta": chunk.content})
+    return "".join(chunks)
+
 
 class judge():
 
     def __init__(self, name: str, role: str):
         self.name = name
         self.role = role
+        self.transcript_name = f"{name}({role})".upper()  #辩论记录中的发言人标识，只需转换一次
 
     
-    def debate_start(self, state: CourtState) -> CourtState:
+    async def debate_start(self, state: CourtState) -> CourtState:
         """法官宣布辩论开始,初始化CourtState，将话语权交给原告律师"""
 
+        opening = f"现在开始法庭辩论，请原告方进行陈述。\n案件信息：{state['case_info']}\n初步证据提交：{state['case_evidence']}"
         return {"phase" : "开庭阶段",
-                "messages" : [ChatMessage(content=f"现在开始法庭辩论，请原告方进行陈述。\n案件信息：{state['case_info']}\n初步证据提交：{state['case_evidence']}",
+                "messages" : [ChatMessage(content=opening,
                                            name = f"{self.name}({self.role})",
                                            role = "assistant")],
+                "formatted_transcript" : append_transcript(state, self.transcript_name, opening),
                 "speaker" : "原告律师",
                 "rounds" : 0
                 }
     
-    def judge_summary(self, state: CourtState) -> CourtState:
+    async def judge_summary(self, state: CourtState) -> CourtState:
         """在这个节点，法官总结双方发言，进一步归纳出争议焦点，引导双方就焦点问题展开进一轮的辩论"""
 
         if state["speaker"] != "法官":
-            return state
+            return {}  #不是自己发言，空更新即保持状态不变
     
         if state["human_role"] == "法官":
             user_input = interrupt("现在请你仔细阅读双方的发言，归纳双方的争议焦点，引导双方就焦点进行辩论")
             return {
                 "messages" : [HumanMessage(content=user_input, name = f"{self.name}({self.role})")],
+                "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                 "speaker" : "原告律师",
                 "phase" : "交叉质证"
             }
         else:
-            model_input = [SystemMessage(content=SUMMARY)] + state["messages"]
-            response = ds_R1.invoke(model_input)
+            model_input = build_context(SYS_SUMMARY, state)
+            content = await generate(get_model(DS_R1), model_input, f"{self.name}({self.role})")
             return {
-                "messages" : [ChatMessage(content=response.content, name = f"{self.name}({self.role})",role = "assistant")], 
+                "messages" : [ChatMessage(content=content, name = f"{self.name}({self.role})",role = "assistant")], 
+                "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                 "speaker" : "原告律师",
                 "phase" : "交叉质证"
             }
     
-    def judge_should_continue(self, state: CourtState) -> str:
+    async def judge_should_continue(self, state: CourtState) -> str:
         """这是一个关键的路由节点，在这个节点由法官决定是否要进行新一轮的辩论，判断逻辑是根据辩论轮次（显式规定），和LLM自行
         根据上下文进行判断是否进行新一轮辩论"""
 
-        state["rounds"] +=1  #计算当前辩论场次
-        if state["rounds"] >= 3:
+        rounds = state["rounds"]  #当前辩论场次，由judge_should_continue节点累加
+        if rounds >= 3:
             return "end"
-        
-        messages = state.get("messages", [])  #面向对象的代码风格
-        # 格式化消息
-        content = "\n".join(
-            [f"{msg.name.upper()}: {msg.content}" for msg in messages]
-        )
+        if rounds < 2:
+            return "continue"  #至少进行两轮交叉质证
 
-        model_input = judge_prompt.format(messages = content)
-        response = ds_R1.invoke(model_input)
+        # 各节点发言时已增量追加格式化记录，无需每轮重新格式化全部历史
+        content = state.get("formatted_transcript", "")
 
-        decision = response.content.strip().lower()
-        if decision not in ["continue", "end"]:
-            decision = "continue" #兜底处理
+        model_input = JUDGE_PROMPT_HEAD + content + JUDGE_PROMPT_TAIL
+        async with llm_slots:
+            response = await get_decider().ainvoke(model_input)
 
-        return decision
+        #只生成一个token，按首字母判断，"end"以外一律继续（兜底处理）
+        return "end" if response.content.strip().lower().startswith("e") else "continue"
     
-    def judge_verdict(self, state: CourtState) -> CourtState:
+    async def judge_verdict(self, state: CourtState) -> CourtState:
         """在这个节点，法官先前已经认为双方辩论已经足够充分，因此法官对本案件进行总结，并进行裁决"""
         
         if state["speaker"] != "法官":
-            return state
+            return {}
         
         if state["human_role"] == "法官":
             user_input = interrupt("既然双方辩论已经充分，请你宣布审判结果")
             return {
                 "messages" : [HumanMessage(content = user_input, name = f"{self.name}({self.role})")],
+                "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                 "phase" : "休庭小结"
             }
         else:
-            model_input = [SystemMessage(content = VERDICT)] + state["messages"]
-            response = ds_R1.invoke(model_input)
+            model_input = (SYS_VERDICT, *state["messages"])  #裁决只做一次，保留完整庭审记录
+            content = await generate(get_model(DS_R1), model_input, f"{self.name}({self.role})")
             return{
-                "messages" : ChatMessage(content = response.content, role = f"{self.name}({self.role})"),
+                "messages" : [ChatMessage(content = content, name = f"{self.name}({self.role})", role = "assistant")],
+                "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                 "phase" : "休庭小结"
             }
         
@@ -99,47 +162,52 @@ class plaintiff():
     def __init__(self, name: str, role: str):
         self.name = name
         self.role = role
+        self.transcript_name = f"{name}({role})".upper()  #辩论记录中的发言人标识，只需转换一次
 
 
-    def plaintiff_statement(self, state: CourtState) -> CourtState:
+    async def plaintiff_statement(self, state: CourtState) -> CourtState:
         """在这个节点，原告做出开场指控陈述，法庭状态记录原告发言，并将话语权交给被告律师"""
 
         #多重检查
         if state["speaker"] != "原告律师":
-            return state
+            return {}
         
         if state["human_role"] == "原告律师":
             # 等待人类原告输入
             user_input = interrupt("现在是开庭阶段，请你作出有力的开庭指控陈述吧！")
             return {"messages" : [HumanMessage(content=user_input, name = f"{self.name}({self.role})")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                     "speaker" : "被告律师"
                     }
         else:
             # AI原告生成陈述
-            model_input = [SystemMessage(content=STATEMENT_PROMPT)] + state["messages"]
-            response = ds_V3.invoke(model_input)
-            return {"messages" : [ChatMessage(content=response.content, name = f"{self.name}({self.role})", role = "assistant")],
+            model_input = build_context(SYS_STATEMENT, state)
+            content = await generate(get_model(DS_V3), model_input, f"{self.name}({self.role})")
+            return {"messages" : [ChatMessage(content=content, name = f"{self.name}({self.role})", role = "assistant")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                     "speaker" : "被告律师"
                     }
     
-    def plaintiff_argue(self, state: CourtState) -> CourtState:
+    async def plaintiff_argue(self, state: CourtState) -> CourtState:
         """在这个节点，原告承接法官的引导，就被告提出的质疑做出回应，进行新一轮辩论法庭状态记录原告发言，并将话语权交给被告律师"""
 
         #多重检查
         if state["speaker"] != "原告律师":
-            return state
+            return {}
         
         if state["human_role"] == "原告律师":
             # 等待人类原告输入
             user_input = interrupt("请你根据法官总结的焦点争议，针对被告的反驳作出回应，并进一步论述自己的主张！")
             return {"messages" : [HumanMessage(content=user_input, name = f"{self.name}({self.role})")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                     "speaker" : "被告律师"
                     }
         else:
             # AI原告生成陈述
-            model_input = [SystemMessage(content=ARGUE_PROMPT_PL)] + state["messages"]
-            response = ds_V3.invoke(model_input)
-            return {"messages" : [ChatMessage(content=response.content, name = f"{self.name}({self.role})", role = "assistant")],
+            model_input = build_context(SYS_ARGUE_PL, state)
+            content = await generate(get_model(DS_V3), model_input, f"{self.name}({self.role})")
+            return {"messages" : [ChatMessage(content=content, name = f"{self.name}({self.role})", role = "assistant")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                     "speaker" : "被告律师"
                     }
         
@@ -148,45 +216,50 @@ class defendant():
     def __init__(self, name: str, role: str):
         self.name = name
         self.role = role
+        self.transcript_name = f"{name}({role})".upper()  #辩论记录中的发言人标识，只需转换一次
 
 
-    def defendant_reply(self, state: CourtState) -> CourtState:
+    async def defendant_reply(self, state: CourtState) -> CourtState:
         """在这个节点，被告针对原告的指控陈述做出答辩，法庭状态记录被告发言，并将话语权移交给法官
         由法官主持进行进一步的交叉质证辩论环节"""
 
 
         if state["speaker"] != "被告律师":
-            return state
+            return {}
         
         if state["human_role"] == "被告律师":
             user_input = interrupt("现在请你就原告做出的开场陈述，进行有力的抗辩吧！")
 
             return {"messages" : [HumanMessage(content=user_input, name = f"{self.name}({self.role})")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                     "speaker" : "法官"
                     }
         else:
-            model_input = [SystemMessage(content=DEMURRER_PROMPT)] + state["messages"]
-            response = ds_V3.invoke(model_input)
-            return {"messages" : [ChatMessage(content=response.content, name = f"{self.name}({self.role})", role = "assistant")],
+            model_input = build_context(SYS_DEMURRER, state)
+            content = await generate(get_model(DS_V3), model_input, f"{self.name}({self.role})")
+            return {"messages" : [ChatMessage(content=content, name = f"{self.name}({self.role})", role = "assistant")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                     "speaker" : "法官"
                     }
         
-    def defendant_argue(self, state: CourtState) -> CourtState:
+    async def defendant_argue(self, state: CourtState) -> CourtState:
         """在这个节点，被告针对原告的指控陈述做出答辩，法庭状态记录被告发言，并将话语权移交给法官
         由法官进一步组织发言"""
 
 
         if state["speaker"] != "被告律师":
-            return state
+            return {}
         
         if state["human_role"] == "被告律师":
             user_input = interrupt("请你就原告的说法进一步质疑，并努力论述自己的观点")
             return {"messages" : [HumanMessage(content=user_input, name = f"{self.name}({self.role})")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, user_input),
                     "speaker" : "法官"
                     }
         else:
-            model_input = [SystemMessage(content=ARGUE_PROMPT_DE)] + state["messages"]
-            response = ds_V3.invoke(model_input)
-            return {"messages" : [ChatMessage(content=response.content, name = f"{self.name}({self.role})", role = "assistant")],
+            model_input = build_context(SYS_ARGUE_DE, state)
+            content = await generate(get_model(DS_V3), model_input, f"{self.name}({self.role})")
+            return {"messages" : [ChatMessage(content=content, name = f"{self.name}({self.role})", role = "assistant")],
+                    "formatted_transcript" : append_transcript(state, self.transcript_name, content),
                     "speaker" : "法官"
                     }
\ No newline at end of file
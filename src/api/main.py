@@ -2,31 +2,49 @@
 FastAPI Main Application
 """
 
+import logging
+import os
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
+from ..logconfig import setup_logging
 from .routes import sessions, websocket
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
 
 # 创建FastAPI应用
 app = FastAPI(
     title="数字法庭API",
     description="基于LangGraph的法庭辩论模拟系统API",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
 )
 
-# 配置CORS
+# 配置CORS：生产环境通过 CORS_ALLOW_ORIGINS 配置具体域名（逗号分隔），未配置时允许所有来源
+# WebSocket请求不经过CORS处理
+cors_origins = [
+    origin.strip()
+    for origin in os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 生产环境应该配置具体的域名
+    allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST", "DELETE"],  # 仅限会话API实际使用的方法
     allow_headers=["*"],
 )
 
+# 压缩较大的REST响应（如包含完整消息历史的会话状态）
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # 添加路由
 app.include_router(sessions.router)
 app.include_router(websocket.router)
@@ -37,7 +55,7 @@ if examples_path.exists():
     # 使用html=True参数，这样访问/examples/时会自动返回index.html
     app.mount("/examples", StaticFiles(directory=examples_path, html=True), name="examples")
 else:
-    print(f"警告: examples目录不存在于 {examples_path}")
+    logger.warning("examples目录不存在于 %s", examples_path)
 
 
 # 全局异常处理
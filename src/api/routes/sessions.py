@@ -43,11 +43,12 @@ async def create_session(request: CreateSessionRequest):
 
         session_data = await court_service.get_session(session_id)
 
-        return CreateSessionResponse(
-            session_id=session_id,
-            current_phase=session_data["current_phase"],
-            current_speaker=session_data["current_speaker"],
-        )
+        # 直接返回字典，由response_model完成唯一一次校验和序列化
+        return {
+            "session_id": session_id,
+            "current_phase": session_data["current_phase"],
+            "current_speaker": session_data["current_speaker"],
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建会话失败: {str(e)}")
@@ -69,7 +70,7 @@ async def get_session(session_id: str):
     """
     try:
         session_data = await court_service.get_session(session_id)
-        return SessionStatusResponse(**session_data)
+        return session_data
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -94,11 +95,11 @@ async def end_session(session_id: str):
         session_data = await court_service.get_session(session_id)
         await court_service.cleanup_session(session_id)
 
-        return EndSessionResponse(
-            status="ended",
-            final_phase=session_data["current_phase"],
-            total_rounds=session_data["rounds"],
-        )
+        return {
+            "status": "ended",
+            "final_phase": session_data["current_phase"],
+            "total_rounds": session_data["rounds"],
+        }
 
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -2,14 +2,21 @@
 WebSocket API Routes for real-time courtroom updates
 """
 
-import json
+import logging
+
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
 from typing import Optional
 
 from ...services.court_service import court_service, CourtSession
-from ...api.websocket.manager import manager
+from ...api.websocket.manager import manager, encode_event
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# 心跳是最频繁的事件：按前缀识别紧凑格式的ping，直接回复预先序列化的pong
+PING_PREFIX = '{"event":"ping"'
+PONG_TEXT = encode_event("pong", {})
 
 
 @router.websocket("/ws/{session_id}")
@@ -35,6 +42,12 @@ async def websocket_endpoint(
     # 建立连接
     await manager.connect(session_id, websocket, role)
 
+    # 接受连接期间会话可能已被清理
+    if court_service.get_session_object(session_id) is not session:
+        manager.disconnect(session_id, websocket)
+        await websocket.close(code=1008, reason="Session not found")
+        return
+
     # 将会话添加到WebSocket连接集合
     session.websocket_connections.add(websocket)
 
@@ -46,16 +59,17 @@ async def websocket_endpoint(
             {"session_id": session_id, "message": "已连接到法庭", "role": role},
         )
 
-        # 发送当前状态
-        session_data = await court_service.get_session(session_id)
-        await manager.send_to_connection(
-            websocket, "status_update", session_data
-        )
+        # 发送当前状态，状态未变化时各连接复用同一份序列化结果
+        await manager.send_encoded(websocket, "status_update", session.to_json())
 
         # 持续接收消息
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
+            if data.startswith(PING_PREFIX):
+                await websocket.send_text(PONG_TEXT)
+                continue
+
+            message = orjson.loads(data)
             event = message.get("event")
             event_data = message.get("data", {})
 
@@ -66,7 +80,7 @@ async def websocket_endpoint(
         if session:
             session.websocket_connections.discard(websocket)
     except Exception as e:
-        print(f"WebSocket错误: {str(e)}")
+        logger.warning("WebSocket错误: %s", e)
         manager.disconnect(session_id, websocket)
         if session:
             session.websocket_connections.discard(websocket)
@@ -135,15 +149,13 @@ async def handle_human_input(session_id: str, data: dict, websocket: WebSocket):
         return
 
     try:
-        # 提交人类输入
-        await court_service.submit_human_input(session_id, role, content)
-
-        # 获取更新后的状态
-        session_data = await court_service.get_session(session_id)
-
-        # 广播更新消息
-        await manager.broadcast_to_session(
-            session_id, "debate_update", {"new_message": session_data["messages"][-1] if session_data["messages"] else None}
+        # 提交人类输入，后续AI发言的增量内容与每条新发言实时推送
+        await court_service.submit_human_input(
+            session_id,
+            role,
+            content,
+            on_token=token_broadcaster(session_id),
+            on_message=message_broadcaster(session_id),
         )
 
     except Exception as e:
@@ -161,8 +173,12 @@ async def handle_next_step(session_id: str, websocket: WebSocket):
         websocket: WebSocket连接对象
     """
     try:
-        # 推进辩论
-        session_data = await court_service.advance_debate(session_id)
+        # 推进辩论，AI发言的增量内容与每条新发言实时推送
+        session_data = await court_service.advance_debate(
+            session_id,
+            on_token=token_broadcaster(session_id),
+            on_message=message_broadcaster(session_id),
+        )
 
         # 检查是否需要人类输入
         if session_data["requires_human_input"]:
@@ -175,14 +191,12 @@ async def handle_next_step(session_id: str, websocket: WebSocket):
                 },
             )
         else:
-            # 广播更新消息
+            # 新发言已逐条推送，这里只广播发言人与阶段的变化
             await manager.broadcast_to_session(
                 session_id,
                 "debate_update",
                 {
-                    "new_message": session_data["messages"][-1]
-                    if session_data["messages"]
-                    else None,
+                    "new_message": None,
                     "speaker_changed": True,
                     "new_speaker": session_data["current_speaker"],
                     "phase_changed": False,
@@ -199,6 +213,52 @@ async def handle_next_step(session_id: str, websocket: WebSocket):
         )
 
 
+def token_broadcaster(session_id: str):
+    """
+    生成把模型增量输出广播为token_delta事件的回调
+
+    Args:
+        session_id: 法庭会话ID
+
+    Returns:
+        接收 {"speaker": ..., "delta": ...} 的异步回调
+    """
+
+    async def on_token(delta: dict):
+        await manager.broadcast_to_session(session_id, "token_delta", delta)
+
+    return on_token
+
+
+def message_broadcaster(session_id: str):
+    """
+    生成把节点新发言广播为debate_update事件的回调
+
+    Args:
+        session_id: 法庭会话ID
+
+    Returns:
+        接收格式化消息及当步状态的异步回调
+    """
+
+    async def on_message(message: dict, state: dict):
+        # 每条发言都带上当步的阶段、发言人与轮次，前端收到消息时同步刷新
+        await manager.broadcast_to_session(
+            session_id,
+            "debate_update",
+            {
+                "new_message": message,
+                "speaker_changed": True,
+                "new_speaker": state.get("speaker", ""),
+                "phase_changed": False,
+                "current_phase": state.get("phase", ""),
+                "round": state.get("rounds", 0),
+            },
+        )
+
+    return on_message
+
+
 async def broadcast_debate_update(session_id: str, message_data: dict):
     """
     广播辩论更新消息
@@ -2,11 +2,40 @@
 WebSocket Connection Manager for real-time courtroom communication
 """
 
-from typing import Dict, Set, Optional
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-import json
+import logging
+import orjson
 import asyncio
 
+logger = logging.getLogger(__name__)
+
+# 单次发送的超时时间（秒），超时的连接会被清理
+SEND_TIMEOUT = 5.0
+# 每批并发发送的连接数，批次之间让出事件循环，避免观众很多时长时间占用循环
+BROADCAST_BATCH_SIZE = 50
+
+
+def encode_event(event: str, data: dict) -> str:
+    """
+    序列化WebSocket事件
+
+    orjson直接输出UTF-8，解码一次后以文本帧发送，前端仍可直接JSON.parse。
+    固定不变的帧（如pong）由调用方在导入时预先序列化
+    """
+    return orjson.dumps({"event": event, "data": data}).decode()
+
+
+def wrap_encoded(event: str, encoded_data: str) -> str:
+    """
+    用已序列化的数据拼出事件，数据不再重新编码
+
+    Args:
+        event: 事件类型
+        encoded_data: 已序列化为JSON的事件数据
+    """
+    return f'{{"event":{orjson.dumps(event).decode()},"data":{encoded_data}}}'
+
 
 class ConnectionManager:
     """
@@ -14,8 +43,11 @@ class ConnectionManager:
     """
 
     def __init__(self):
-        # session_id -> set of WebSocket connections
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # session_id -> list of WebSocket connections
+        # 单个会话的连接数很少，列表按引用比较即可，省去对WebSocket对象求哈希
+        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # 正在后台关闭的连接任务，保留引用防止任务被回收
+        self._closing: Set[asyncio.Task] = set()
 
     async def connect(self, session_id: str, websocket: WebSocket, role: Optional[str] = None):
         """
@@ -29,10 +61,15 @@ class ConnectionManager:
         await websocket.accept()
 
         if session_id not in self.active_connections:
-            self.active_connections[session_id] = set()
+            self.active_connections[session_id] = []
 
-        self.active_connections[session_id].add(websocket)
-        print(f"WebSocket连接建立: session={session_id}, connections={len(self.active_connections[session_id])}")
+        self.active_connections[session_id].append(websocket)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "WebSocket连接建立: session=%s, connections=%d",
+                session_id,
+                len(self.active_connections[session_id]),
+            )
 
     def disconnect(self, session_id: str, websocket: WebSocket):
         """
@@ -42,13 +79,21 @@ class ConnectionManager:
             session_id: 法庭会话ID
             websocket: WebSocket连接对象
         """
-        if session_id in self.active_connections:
-            self.active_connections[session_id].discard(websocket)
-
-            if len(self.active_connections[session_id]) == 0:
+        connections = self.active_connections.get(session_id)
+        if connections is not None:
+            try:
+                index = connections.index(websocket)
+            except ValueError:
+                pass
+            else:
+                # 与末尾元素交换后弹出，连接顺序无关紧要
+                connections[index] = connections[-1]
+                connections.pop()
+
+            if len(connections) == 0:
                 del self.active_connections[session_id]
 
-        print(f"WebSocket连接断开: session={session_id}")
+        logger.debug("WebSocket连接断开: session=%s", session_id)
 
     async def broadcast_to_session(self, session_id: str, event: str, data: dict):
         """
@@ -62,19 +107,55 @@ class ConnectionManager:
         if session_id not in self.active_connections:
             return
 
-        message = json.dumps({"event": event, "data": data}, ensure_ascii=False)
+        message = encode_event(event, data)
+
+        # 分批并发发送，单个慢连接不会阻塞其他连接；超时未发出的连接视为断开
+        connections = self.active_connections[session_id]
+        sending = connections[:]
+        failed = []
+        for start in range(0, len(sending), BROADCAST_BATCH_SIZE):
+            if start:
+                await asyncio.sleep(0)  #批次之间让出事件循环
+            batch = sending[start:start + BROADCAST_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(
+                    asyncio.wait_for(connection.send_text(message), timeout=SEND_TIMEOUT)
+                    for connection in batch
+                ),
+                return_exceptions=True,
+            )
+            for connection, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.warning("发送消息失败: %r", result)
+                    failed.append(connection)
+
+        # 原地剔除发送失败的连接（发送期间新加入的连接保留）
+        if failed:
+            for connection in failed:
+                self._close_evicted(connection)
+            connections[:] = [c for c in connections if c not in failed]
+            # 发送期间会话可能已被disconnect清空并删除
+            if len(connections) == 0 and self.active_connections.get(session_id) is connections:
+                del self.active_connections[session_id]
+            logger.debug("WebSocket连接断开: session=%s, count=%d", session_id, len(failed))
 
-        disconnected = set()
-        for connection in self.active_connections[session_id]:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                print(f"发送消息失败: {str(e)}")
-                disconnected.add(connection)
+    def _close_evicted(self, websocket: WebSocket):
+        """
+        在后台关闭被剔除的连接，客户端收到关闭帧后可以重连；不等待关闭完成
+
+        Args:
+            websocket: WebSocket连接对象
+        """
+        task = asyncio.create_task(self._close_quietly(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
 
-        # 清理断开的连接
-        for connection in disconnected:
-            self.disconnect(session_id, connection)
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=SEND_TIMEOUT)
+        except Exception as e:
+            logger.debug("关闭WebSocket连接失败: %r", e)
 
     async def send_to_connection(self, websocket: WebSocket, event: str, data: dict):
         """
@@ -85,8 +166,18 @@ class ConnectionManager:
             event: 事件类型
             data: 事件数据
         """
-        message = json.dumps({"event": event, "data": data}, ensure_ascii=False)
-        await websocket.send_text(message)
+        await websocket.send_text(encode_event(event, data))
+
+    async def send_encoded(self, websocket: WebSocket, event: str, encoded_data: str):
+        """
+        向单个WebSocket连接发送数据已序列化的消息
+
+        Args:
+            websocket: WebSocket连接对象
+            event: 事件类型
+            encoded_data: 已序列化为JSON的事件数据
+        """
+        await websocket.send_text(wrap_encoded(event, encoded_data))
 
     def get_connection_count(self, session_id: str) -> int:
         """
@@ -98,7 +189,7 @@ class ConnectionManager:
         Returns:
             连接数
         """
-        return len(self.active_connections.get(session_id, set()))
+        return len(self.active_connections.get(session_id, ()))
 
 
 # 全局连接管理器实例
@@ -1,9 +1,39 @@
+import asyncio
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import httpx
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
-models = {
-    "DeepSeek_V3" : ChatOpenAI(model= "DeepSeek-V3"),
-    "DeepSeek_R1" : ChatOpenAI(model= "DeepSeek-R1")
-}
\ No newline at end of file
+# 单个进程内同时发往模型服务的最大请求数，超出的请求在进程内排队等待
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "50"))
+llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.AsyncClient:
+    """所有模型共享的异步连接池，并发请求复用同一批keep-alive连接"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=LLM_CONCURRENCY),
+        timeout=60,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_model(name: str) -> "ChatOpenAI":
+    """按模型名懒加载客户端，每个进程只构建一次"""
+    # 模型SDK导入较慢，推迟到第一次构建客户端时，缩短服务冷启动
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=name,
+        timeout=60,
+        max_retries=2,
+        http_async_client=get_http_client(),
+    )
@@ -0,0 +1,30 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+
+def setup_logging():
+    """配置日志：记录先进入队列，由后台线程写出，事件循环上只做入队操作"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    # 入队时只合并消息参数，完整格式由后台线程中的handler负责
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    # 第三方库（如httpx每次请求一条INFO）只输出WARNING及以上，LOG_LEVEL只作用于本项目的src.*日志
+    logging.basicConfig(level=logging.WARNING, handlers=[queue_handler])
+    logging.getLogger("src").setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -2,10 +2,14 @@
 Court Service - Core service layer that encapsulates LangGraph logic
 """
 
-from typing import Dict, List, Optional, Set
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 import uuid
 from datetime import datetime
 import asyncio
+import heapq
+import logging
+import time
+import orjson
 from langchain_core.messages import ChatMessage, HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import Command
@@ -14,6 +18,19 @@ from src.workflow import app
 from src.state import CourtState, evidence
 from src.schemas.session import CourtRole
 
+logger = logging.getLogger(__name__)
+
+# 接收模型增量输出的回调，参数为 {"speaker": ..., "delta": ...}
+TokenCallback = Callable[[dict], Awaitable[None]]
+# 接收节点新发言的回调，参数为格式化后的单条消息及该步完成后的状态
+MessageCallback = Callable[[dict, CourtState], Awaitable[None]]
+
+# 消息类型到接口role的映射，按type()精确查表
+_ROLE_BY_TYPE = {ChatMessage: "assistant", HumanMessage: "human"}
+
+# 会话无活动多久后被清理（秒）
+SESSION_TTL = 10800
+
 
 class CourtSession:
     """
@@ -23,15 +40,69 @@ class CourtSession:
     def __init__(self, session_id: str, human_role: Optional[CourtRole] = None):
         self.session_id = session_id
         self.human_role = human_role
-        self.created_at = datetime.now()
-        self.last_activity = datetime.now()
+        self._human_role_value = human_role.value if human_role else None
+        self.created_at = datetime.now()  #墙上时间，仅用于展示
+        self.last_activity = time.monotonic()  #只用于计算过期，单调时钟不受系统时间调整影响
+        self.expires_at = 0.0  #过期时刻（time.monotonic），由CourtService维护
         self.app = app
         self.config = {"configurable": {"thread_id": session_id}}
         self.state: Optional[CourtState] = None
         self.websocket_connections: Set = set()
-        self.requires_human_input = False
-        self.pending_input_role: Optional[str] = None
         self._lock = asyncio.Lock()
+        self.closed = False  #会话已被清理，排队中的推进请求不再运行工作流
+        # 状态每变化一次版本号加一，序列化结果按版本号缓存
+        self._version = 0
+        self._encoded: Optional[str] = None
+        self._encoded_version = -1
+        # 已格式化的消息及对应的消息下标；消息历史只追加，每次只需格式化新增部分
+        self._formatted_cache: List[dict] = []
+        self._formatted_cursor = 0
+
+    @property
+    def requires_human_input(self) -> bool:
+        """工作流只会在中断或结束时停下：未结束且轮到人类扮演的角色，即在等待人类输入"""
+        return (
+            self.state is not None
+            and self._human_role_value is not None
+            and self.state.get("speaker") == self._human_role_value
+            and self.state.get("phase") != "休庭小结"
+        )
+
+    @property
+    def pending_input_role(self) -> Optional[str]:
+        """等待输入的角色，不需要人类输入时为None"""
+        return self._human_role_value if self.requires_human_input else None
+
+    async def _run(
+        self,
+        input_data,
+        on_token: Optional[TokenCallback] = None,
+        on_message: Optional[MessageCallback] = None,
+    ) -> CourtState:
+        """运行工作流直到下一个中断点或结束
+
+        模型的增量输出交给on_token；每一步完成后，新增的发言立即格式化（记下发言时间）
+        并交给on_message，不必等整段运行结束。
+
+        durability="exit"：只在本次运行结束（中断或完成）时写一次检查点，
+        不再在每个节点之后序列化整个状态，人类输入的恢复语义不受影响
+        """
+        async for mode, chunk in self.app.astream(
+            input_data,
+            self.config,
+            stream_mode=["custom", "values"],
+            durability="exit",
+        ):
+            if mode == "values":
+                self.state = chunk
+                self._version += 1
+                new_messages = self._sync_formatted()
+                if on_message is not None:
+                    for formatted in new_messages:
+                        await on_message(formatted, chunk)
+            elif on_token is not None:
+                await on_token(chunk)
+        return self.state
 
     async def initialize(self, case_info: str, case_evidence: List[dict]):
         """初始化法庭状态"""
@@ -44,18 +115,26 @@ class CourtSession:
                 ],
                 "phase": "准备阶段",
                 "messages": [],
+                "formatted_transcript": "",
                 "speaker": "",
-                "human_role": self.human_role.value if self.human_role else None,
+                "human_role": self._human_role_value,
                 "rounds": 0,
             }
 
             # 启动辩论
-            self.state = await asyncio.to_thread(self.app.invoke, initial_state, self.config)
-            self.last_activity = datetime.now()
+            self.state = await self._run(initial_state)
+            self.last_activity = time.monotonic()
 
-    async def advance_debate(self):
+    async def advance_debate(
+        self,
+        on_token: Optional[TokenCallback] = None,
+        on_message: Optional[MessageCallback] = None,
+    ):
         """推进辩论到下一步"""
         async with self._lock:
+            if self.closed:
+                raise ValueError(f"会话已结束: {self.session_id}")
+
             if self.requires_human_input:
                 raise ValueError("需要人类输入，无法自动推进")
 
@@ -66,27 +145,26 @@ class CourtSession:
             if self.state.get("phase") == "休庭小结":
                 return self.state
 
-            # 推进工作流
+            # 推进工作流（当前发言人不是人类，已由上面的检查保证）
             try:
-                # 如果当前发言人不是人类，自动推进
-                current_speaker = self.state.get("speaker", "")
-                if current_speaker != self.human_role:
-                    # 需要推进
-                    self.state = await asyncio.to_thread(self.app.invoke, None, self.config)
-                    self.last_activity = datetime.now()
-
-                    # 检查是否需要人类输入
-                    if self.state.get("speaker") == self.human_role:
-                        self.requires_human_input = True
-                        self.pending_input_role = self.human_role
+                self.state = await self._run(None, on_token, on_message)
+                self.last_activity = time.monotonic()
 
                 return self.state
             except Exception as e:
                 raise RuntimeError(f"推进辩论失败: {str(e)}")
 
-    async def submit_human_input(self, content: str) -> CourtState:
+    async def submit_human_input(
+        self,
+        content: str,
+        on_token: Optional[TokenCallback] = None,
+        on_message: Optional[MessageCallback] = None,
+    ) -> CourtState:
         """提交人类输入并继续工作流"""
         async with self._lock:
+            if self.closed:
+                raise ValueError(f"会话已结束: {self.session_id}")
+
             if not self.requires_human_input:
                 raise ValueError("当前不需要人类输入")
 
@@ -95,35 +173,53 @@ class CourtSession:
 
             try:
                 # 使用Command.resume继续执行
-                self.state = await asyncio.to_thread(
-                    self.app.invoke,
-                    Command(resume=content),
-                    self.config
-                )
-
-                self.requires_human_input = False
-                self.pending_input_role = None
-                self.last_activity = datetime.now()
+                self.state = await self._run(Command(resume=content), on_token, on_message)
+                self.last_activity = time.monotonic()
 
                 return self.state
             except Exception as e:
                 raise RuntimeError(f"提交人类输入失败: {str(e)}")
 
-    def get_formatted_messages(self) -> List[dict]:
-        """获取格式化的消息历史"""
+    def format_message(self, msg, timestamp: str) -> Optional[dict]:
+        """把单条消息转换为接口格式，不是发言的消息返回None"""
+        role = _ROLE_BY_TYPE.get(type(msg))
+        if role is None:
+            return None
+        return {
+            "sender": getattr(msg, "name", "未知"),
+            "content": msg.content,
+            "role": role,
+            "timestamp": timestamp
+        }
+
+    def _sync_formatted(self) -> List[dict]:
+        """格式化上次之后新增的消息并追加到缓存，返回新增部分
+
+        每一步的新状态到达时调用，新消息的时间戳即其发言完成的时间
+        """
         if not self.state or not self.state.get("messages"):
             return []
 
-        messages = []
-        for msg in self.state["messages"]:
-            if isinstance(msg, (ChatMessage, HumanMessage)):
-                messages.append({
-                    "sender": getattr(msg, "name", "未知"),
-                    "content": msg.content,
-                    "role": "assistant" if isinstance(msg, ChatMessage) else "human",
-                    "timestamp": self.created_at.isoformat()
-                })
-        return messages
+        history = self.state["messages"]
+        if len(history) < self._formatted_cursor:
+            # 历史被重置，缓存失效
+            self._formatted_cache = []
+            self._formatted_cursor = 0
+
+        start = len(self._formatted_cache)
+        if self._formatted_cursor < len(history):
+            timestamp = datetime.now().isoformat()  #同一步新增的消息共用一个时间戳
+            for msg in history[self._formatted_cursor:]:
+                formatted = self.format_message(msg, timestamp)
+                if formatted is not None:
+                    self._formatted_cache.append(formatted)
+            self._formatted_cursor = len(history)
+        return self._formatted_cache[start:]
+
+    def get_formatted_messages(self) -> List[dict]:
+        """获取格式化的消息历史"""
+        self._sync_formatted()
+        return self._formatted_cache[:]  #浅拷贝，调用方持有的列表不会随后续发言变化
 
     def to_dict(self) -> dict:
         """转换为字典格式"""
@@ -136,9 +232,16 @@ class CourtSession:
             "rounds": self.state.get("rounds", 0) if self.state else 0,
             "requires_human_input": self.requires_human_input,
             "pending_input_role": self.pending_input_role,
-            "human_role": self.human_role.value if self.human_role else None,
+            "human_role": self._human_role_value,
         }
 
+    def to_json(self) -> str:
+        """to_dict的JSON序列化结果，状态未变化时直接复用，多个连接共享同一份"""
+        if self._encoded_version != self._version:
+            self._encoded = orjson.dumps(self.to_dict()).decode()
+            self._encoded_version = self._version
+        return self._encoded
+
 
 class CourtService:
     """
@@ -148,6 +251,16 @@ class CourtService:
     def __init__(self):
         self.sessions: Dict[str, CourtSession] = {}
         self._cleanup_task = None
+        # (过期时刻, session_id) 最小堆；会话每次活动都压入新条目，旧条目在出堆时丢弃
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._expiry_wakeup = asyncio.Event()
+
+    def _touch(self, session: CourtSession):
+        """记录会话活动，顺延其过期时刻"""
+        session.expires_at = session.last_activity + SESSION_TTL
+        heapq.heappush(self._expiry_heap, (session.expires_at, session.session_id))
+        # 新条目的过期时刻不早于堆中已有条目，只有堆从空变为非空时才需要唤醒清理任务
+        self._expiry_wakeup.set()
 
     def _start_cleanup_task(self):
         """启动定时清理任务（懒加载，在第一个会话创建时调用）"""
@@ -159,23 +272,31 @@ class CourtService:
                 pass
 
     async def _cleanup_expired_sessions(self):
-        """清理3小时未活动的会话"""
+        """清理3小时未活动的会话，每次只睡到堆顶会话的过期时刻"""
         while True:
             try:
-                await asyncio.sleep(3600)  # 每小时检查一次
-                now = datetime.now()
-                expired_sessions = [
-                    session_id
-                    for session_id, session in self.sessions.items()
-                    if (now - session.last_activity).total_seconds() > 10800  # 3小时
-                ]
-
-                for session_id in expired_sessions:
-                    await self.cleanup_session(session_id)
-                    print(f"清理过期会话: {session_id}")
+                if not self._expiry_heap:
+                    self._expiry_wakeup.clear()
+                    await self._expiry_wakeup.wait()
+                    continue
+
+                expires_at, session_id = self._expiry_heap[0]
+                delay = expires_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                heapq.heappop(self._expiry_heap)
+                session = self.sessions.get(session_id)
+                # 会话已被删除，或之后又有活动（堆中还有更晚的条目）
+                if session is None or session.expires_at > expires_at:
+                    continue
+
+                await self.cleanup_session(session_id)
+                logger.info("清理过期会话: %s", session_id)
 
             except Exception as e:
-                print(f"清理会话时出错: {str(e)}")
+                logger.exception("清理会话时出错: %s", e)
 
     async def create_session(
         self,
@@ -205,6 +326,7 @@ class CourtService:
 
         # 存储会话
         self.sessions[session_id] = session
+        self._touch(session)
 
         return session_id
 
@@ -221,17 +343,21 @@ class CourtService:
         Raises:
             ValueError: 会话不存在
         """
-        if session_id not in self.sessions:
-            raise ValueError(f"会话不存在: {session_id}")
-
-        return self.sessions[session_id].to_dict()
+        return self._require_session(session_id).to_dict()
 
-    async def advance_debate(self, session_id: str) -> dict:
+    async def advance_debate(
+        self,
+        session_id: str,
+        on_token: Optional[TokenCallback] = None,
+        on_message: Optional[MessageCallback] = None,
+    ) -> dict:
         """
         推进辩论
 
         Args:
             session_id: 会话ID
+            on_token: 接收模型增量输出的回调（可选）
+            on_message: 接收每个节点新发言的回调（可选）
 
         Returns:
             更新后的会话状态
@@ -239,16 +365,19 @@ class CourtService:
         Raises:
             ValueError: 会话不存在或需要人类输入
         """
-        if session_id not in self.sessions:
-            raise ValueError(f"会话不存在: {session_id}")
-
-        session = self.sessions[session_id]
-        await session.advance_debate()
+        session = self._require_session(session_id)
+        await session.advance_debate(on_token, on_message)
+        self._touch(session)
 
         return session.to_dict()
 
     async def submit_human_input(
-        self, session_id: str, role: str, content: str
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        on_token: Optional[TokenCallback] = None,
+        on_message: Optional[MessageCallback] = None,
     ) -> dict:
         """
         提交人类输入
@@ -257,6 +386,8 @@ class CourtService:
             session_id: 会话ID
             role: 角色
             content: 输入内容
+            on_token: 接收模型增量输出的回调（可选）
+            on_message: 接收每个节点新发言的回调（可选）
 
         Returns:
             更新后的会话状态
@@ -264,11 +395,9 @@ class CourtService:
         Raises:
             ValueError: 会话不存在或不需要输入
         """
-        if session_id not in self.sessions:
-            raise ValueError(f"会话不存在: {session_id}")
-
-        session = self.sessions[session_id]
-        await session.submit_human_input(content)
+        session = self._require_session(session_id)
+        await session.submit_human_input(content, on_token, on_message)
+        self._touch(session)
 
         return session.to_dict()
 
@@ -279,15 +408,25 @@ class CourtService:
         Args:
             session_id: 会话ID
         """
-        if session_id in self.sessions:
-            session = self.sessions[session_id]
+        # 先从字典中移除：关闭连接期间的并发清理与查找都不会再拿到这个会话
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
 
-            # 关闭所有WebSocket连接
-            for websocket in session.websocket_connections:
+        session.closed = True
+        websockets = list(session.websocket_connections)
+
+        # 尽力关闭所有WebSocket连接，客户端可能早已断开
+        for websocket in websockets:
+            try:
                 await websocket.close()
+            except Exception as e:
+                logger.debug("关闭WebSocket连接失败: session=%s, %r", session_id, e)
 
-            # 从字典中移除
-            del self.sessions[session_id]
+        # 等正在运行的工作流退出（它会写下最后一个检查点）后，再释放该会话的全部检查点；
+        # 之后排队拿到锁的请求会因closed直接返回，不会再写入检查点
+        async with session._lock:
+            await session.app.checkpointer.adelete_thread(session_id)
 
     def get_session_object(self, session_id: str) -> Optional[CourtSession]:
         """
@@ -301,6 +440,13 @@ class CourtService:
         """
         return self.sessions.get(session_id)
 
+    def _require_session(self, session_id: str) -> CourtSession:
+        """一次字典查找取出会话，不存在时抛出ValueError"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ValueError(f"会话不存在: {session_id}")
+        return session
+
 
 # 全局服务实例
 court_service = CourtService()
@@ -1,6 +1,18 @@
 from typing import TypedDict,Union,Annotated
 from langchain_core.messages import HumanMessage,ChatMessage
-from langgraph.graph.message import add_messages
+
+
+def append_messages(existing: list, new) -> list:
+    """只追加的reducer：原地扩展已有列表，每一步只处理新增的几条记录
+
+    add_messages每一步都会复制整个历史并按id合并，总开销随辩论长度平方增长；
+    本图的节点只追加发言和证据，从不替换或删除，原地extend即可
+    """
+    if not isinstance(new, list):
+        new = [new]
+    existing.extend(new)
+    return existing
+
 
 class evidence(TypedDict):
     speaker : str
@@ -8,9 +20,10 @@ class evidence(TypedDict):
 
 class CourtState(TypedDict):
     case_info : str  #记录案件的基本信息
-    case_evidence : Annotated[list[evidence], add_messages]  #记录当庭提出的所有证据
+    case_evidence : Annotated[list[evidence], append_messages]  #记录当庭提出的所有证据
     phase : str
-    messages : Annotated[list[Union[ChatMessage,HumanMessage]], add_messages]  #记录法庭辩论的内容
+    messages : Annotated[list[Union[ChatMessage,HumanMessage]], append_messages]  #记录法庭辩论的内容
+    formatted_transcript : str  #按"发言人: 内容"逐条追加的辩论记录，供法官判断是否继续辩论
     speaker : str  #记录当前发言人
     human_role : str
     rounds : int
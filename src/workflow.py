@@ -1,23 +1,23 @@
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
-from src.state import *
-from src.agent import *
+from src.state import CourtState
+from src.agent import judge, plaintiff, defendant
 
 graph = StateGraph(CourtState)
 
-judge = judge("A", "法官")
-plaintiff = plaintiff("B", "原告律师")
-defendant = defendant("C", "被告律师")
+judge_agent = judge("A", "法官")
+plaintiff_agent = plaintiff("B", "原告律师")
+defendant_agent = defendant("C", "被告律师")
 
 #增加节点
-graph.add_node("debate_start", judge.debate_start)
-graph.add_node("plaintiff_statement", plaintiff.plaintiff_statement)
-graph.add_node("plaintiff_argue", plaintiff.plaintiff_argue)
-graph.add_node("defendant_reply", defendant.defendant_reply)
-graph.add_node("defendant_argue", defendant.defendant_argue)
-graph.add_node("judge_summary", judge.judge_summary)
-graph.add_node("judge_should_continue", lambda state:state)
-graph.add_node("judge_verdict", judge.judge_verdict)
+graph.add_node("debate_start", judge_agent.debate_start)
+graph.add_node("plaintiff_statement", plaintiff_agent.plaintiff_statement)
+graph.add_node("plaintiff_argue", plaintiff_agent.plaintiff_argue)
+graph.add_node("defendant_reply", defendant_agent.defendant_reply)
+graph.add_node("defendant_argue", defendant_agent.defendant_argue)
+graph.add_node("judge_summary", judge_agent.judge_summary)
+graph.add_node("judge_should_continue", lambda state:{"rounds" : state["rounds"] + 1})  #每完成一轮交叉质证累加轮次
+graph.add_node("judge_verdict", judge_agent.judge_verdict)
 #增加边
 graph.add_edge(START,"debate_start")
 graph.add_edge("debate_start","plaintiff_statement")
@@ -26,7 +26,7 @@ graph.add_edge("defendant_reply","judge_summary")
 graph.add_edge("judge_summary","plaintiff_argue")
 graph.add_edge("plaintiff_argue","defendant_argue")
 graph.add_edge("defendant_argue","judge_should_continue")
-graph.add_conditional_edges("judge_should_continue",judge.judge_should_continue,
+graph.add_conditional_edges("judge_should_continue",judge_agent.judge_should_continue,
                             {
                                 "end" : "judge_verdict",
                                 "continue" : "judge_summary"